@@ -21,6 +21,30 @@ def pi_1(x):
     return (1-eps)*x
 
 
+# these are the power functions used by the p-mean aggregators. For the integer values of p, the power is computed with
+# multiplications (by repeated squaring) and the root with square roots where possible, instead of using torch.pow,
+# which is slower on the element-wise tensors aggregated by the quantifiers.
+def power(x, p):
+    if isinstance(p, int) and p > 0:
+        result = None
+        while p:
+            if p & 1:
+                result = x if result is None else result * x
+            p >>= 1
+            if p:
+                x = x * x
+        return result
+    return torch.pow(x, p)
+
+
+def root(x, p):
+    if p == 2:
+        return torch.sqrt(x)
+    if p == 4:
+        return torch.sqrt(torch.sqrt(x))
+    return torch.pow(x, 1 / p)
+
+
 # here, it begins the implementation of fuzzy operators in PyTorch
 class NotStandard:
     def __call__(self, x):
@@ -138,7 +162,7 @@ class AggregMax:
 class AggregMean:
     def __call__(self, xs, dim=None, keepdim=False):
         numerator = torch.nansum(xs, dim=dim, keepdim=keepdim)
-        denominator = torch.sum(~torch.isnan(xs), dim=dim, keepdim=keepdim)
+        denominator = torch.sum(torch.isnan(xs).logical_not_(), dim=dim, keepdim=keepdim)
         return torch.div(numerator / denominator)
 
 
@@ -152,13 +176,20 @@ class AggregPMean:
         stable = self.stable if stable is None else stable
         if stable:
             xs = pi_0(xs)
-        xs = torch.pow(xs, p)
+        xs = power(xs, p)
         numerator = torch.nansum(xs, dim=dim, keepdim=keepdim)
-        denominator = torch.sum(~torch.isnan(xs), dim=dim, keepdim=keepdim)
-        return torch.pow(torch.div(numerator, denominator), 1 / p)
+        denominator = torch.sum(torch.isnan(xs).logical_not_(), dim=dim, keepdim=keepdim)
+        return root(torch.div(numerator, denominator), p)
 
 
 class AggregPMeanError:
+    """p-mean error aggregator: 1 - (mean((1 - x)^p))^(1/p), where NaN values are not counted.
+
+    Besides a tensor, xs can be a list (or tuple) of groundings of formulas, for example the axioms of a knowledge base.
+    In this case, the aggregation is computed over all the values of the groundings in the list, as it would be on
+    the tensor obtained by stacking them with dim=None, but without stacking them in a new tensor. NaN values are
+    not counted, as for tensors. dim and keepdim can't be given with a list.
+    """
     def __init__(self, p=2, stable=True):
         self.p = p
         self.stable = stable
@@ -166,9 +197,17 @@ class AggregPMeanError:
     def __call__(self, xs, dim=None, keepdim=False, p=None, stable=None):
         p = self.p if p is None else p
         stable = self.stable if stable is None else stable
+        if isinstance(xs, (list, tuple)):
+            if dim is not None or keepdim:
+                raise ValueError("The dim and keepdim parameters can't be given when a list of groundings is "
+                                 "aggregated.")
+            errors = [power(1. - (pi_0(x) if stable else x), p) for x in xs]
+            numerator = sum(torch.nansum(error) for error in errors)
+            denominator = sum(torch.sum(torch.isnan(error).logical_not_()) for error in errors)
+            return 1. - root(torch.div(numerator, denominator), p)
         if stable:
             xs = pi_0(xs)
-        xs = torch.pow(1. - xs, p)
+        xs = power(1. - xs, p)
         numerator = torch.nansum(xs, dim=dim, keepdim=keepdim)
-        denominator = torch.sum(~torch.isnan(xs), dim=dim, keepdim=keepdim)
-        return 1. - torch.pow(torch.div(numerator, denominator), 1 / p)
\ No newline at end of file
+        denominator = torch.sum(torch.isnan(xs).logical_not_(), dim=dim, keepdim=keepdim)
+        return 1. - root(torch.div(numerator, denominator), p)
\ No newline at end of file
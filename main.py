@@ -36,13 +36,15 @@ def main():
 
     f1 = ltn.Function("f1", [d_img, l_img], d_img, layers_size=(7, 4, 2, 4, 2, 4))
 
-    print(f1([imgs.get_grounding(), labels.get_grounding()]))
+    # the outputs of the predicates and functions are only shown, so the autograd graph is not built
+    with torch.no_grad():
+        print(f1([imgs.get_grounding(), labels.get_grounding()]))
 
-    print(P1([var_point.get_grounding()]))
+        print(P1([var_point.get_grounding()]))
 
-    print(P1([c.get_grounding()]))
+        print(P1([c.get_grounding()]))
 
-    print(P([imgs.get_grounding(), labels.get_grounding()]))
+        print(P([imgs.get_grounding(), labels.get_grounding()]))
 
     prop = ltn.PropositionalVariable('prop', [0.4], False)
 
@@ -1,6 +1,7 @@
 import ltn
 import numpy as np
 import torch
+import torch.nn.functional as F
 
 class ModelC(torch.nn.Module):
     def __init__(self):
@@ -17,6 +18,32 @@ class ModelC(torch.nn.Module):
         x = self.dense2(x)
         return torch.sum(x * l, dim=1)
 
+
+class ModelClassifier(torch.nn.Module):
+    def __init__(self):
+        super(ModelClassifier, self).__init__()
+        self.dense1 = torch.nn.Linear(4, 5)
+        self.dense2 = torch.nn.Linear(5, 3)  # returns one value for each class
+
+    def forward(self, x):
+        # the layers are applied with the functional interface, to avoid the dispatch of the nn.Module calls
+        x = F.elu(F.linear(x, self.dense1.weight, self.dense1.bias))
+        # each class is an independent fuzzy predicate (as in multi-label classification), so a sigmoid is used in place
+        # of a softmax over the classes. The truth values are computed in float32 also when the linear layers run in
+        # lower precision
+        return torch.sigmoid(F.linear(x, self.dense2.weight, self.dense2.bias).float())
+
+
+def pairwise_sq_dist(a, b):
+    """
+    It computes the matrix of the squared euclidean distances between the rows of a and the rows of b, as
+    ||a||^2 + ||b||^2 - 2ab. In this way, the [n_a, n_b, d] tensor of the differences is never created, and the
+    square root is not taken, since the distances are only compared with thresholds.
+    """
+    sq_norms = torch.sum(a * a, dim=1, keepdim=True) + torch.sum(b * b, dim=1, keepdim=True).t()
+    # the decomposition can give small negative values due to rounding errors
+    return torch.clamp_min(torch.addmm(sq_norms, a, b.t(), alpha=-2), 0.)
+
 def main():
     np.random.seed(120)
     Not = ltn.WrapperConnective(ltn.fuzzy_ops.NotStandard())
@@ -43,54 +70,81 @@ def main():
     Forall = ltn.WrapperQuantifier(ltn.fuzzy_ops.AggregPMeanError(p=2), quantifier="forall")
     Exists = ltn.WrapperQuantifier(ltn.fuzzy_ops.AggregPMean(p=5), quantifier="exists")
 
-    print("shape of Eq([x, y])", Eq([x.get_grounding(), y.get_grounding()]).shape)
+    # the groundings of the formulas are computed once, and they are reused by all the quantifications below
+    eq_x_y = Eq([x.get_grounding(), y.get_grounding()])
+    eq_x_c1 = Eq([x.get_grounding(), c1.get_grounding()])
 
-    print("shape of Forall(x, Eq([x, y]))", Forall(x.get_grounding(), Eq([x.get_grounding(), y.get_grounding()])).shape)
+    print("shape of Eq([x, y])", eq_x_y.shape)
+
+    print("shape of Forall(x, Eq([x, y]))", Forall(x.get_grounding(), eq_x_y).shape)
 
     print("blocco quantificatori")
 
-    print(Forall([x.get_grounding(), y.get_grounding()], Eq([x.get_grounding(), y.get_grounding()])))
+    print(Forall([x.get_grounding(), y.get_grounding()], eq_x_y))
 
-    print(Exists([x.get_grounding(), y.get_grounding()], Eq([x.get_grounding(), y.get_grounding()])))
+    print(Exists([x.get_grounding(), y.get_grounding()], eq_x_y))
 
-    print(Forall(x.get_grounding(), Exists(y.get_grounding(), Eq([x.get_grounding(), y.get_grounding()]))))
+    print(Forall(x.get_grounding(), Exists(y.get_grounding(), eq_x_y)))
 
     print("blocco p differenti")
 
-    print(Forall(x.get_grounding(), Eq([x.get_grounding(), c1.get_grounding()]), p=2))
+    print(Forall(x.get_grounding(), eq_x_c1, p=2))
 
     # %%
-    print(Forall(x.get_grounding(), Eq([x.get_grounding(), c1.get_grounding()]), p=10))
+    print(Forall(x.get_grounding(), eq_x_c1, p=10))
 
     # %%
 
-    print(Exists(x.get_grounding(), Eq([x.get_grounding(), c1.get_grounding()]), p=2))
+    print(Exists(x.get_grounding(), eq_x_c1, p=2))
 
     # %%
 
-    print(Exists(x.get_grounding(), Eq([x.get_grounding(), c1.get_grounding()]), p=10))
+    print(Exists(x.get_grounding(), eq_x_c1, p=10))
+
+    print("formula aggregation")
+
+    SatAgg = ltn.fuzzy_ops.AggregPMeanError(p=2)
+
+    print(SatAgg([Forall(x.get_grounding(), eq_x_c1),
+                  Exists(x.get_grounding(), Eq([x.get_grounding(), c2.get_grounding()]))]))
 
     print("guarded")
 
+    # the data of the guarded quantification and of the classifiers is moved once to the device, together with the
+    # models, so that the evaluation of the formulas does not need transfers between host and device
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
     dom_points = ltn.Domain([2], "points")
     dom_var = ltn.Domain([1], 'dom_var')
 
-    points = np.random.rand(50, 2)  # 5 values in [0,1]^2
+    # the points are converted to a tensor once, and the groundings of x and y share its values
+    points = torch.from_numpy(np.random.rand(50, 2)).to(device)  # 50 values in [0,1]^2
     x = ltn.Variable('x', dom_points, points)
     y = ltn.Variable('y', dom_points, points)
-    d = ltn.Variable('d', dom_var, [[.1], [.2], [.3], [.4], [.5], [.6], [.7], [.8], [.9]])
-
-    eucl_dist = lambda x, y: torch.unsqueeze(torch.norm(x - y, dim=1), dim=1)  # function measuring euclidian distance
+    d = ltn.Variable('d', dom_var, torch.tensor([[.1], [.2], [.3], [.4], [.5], [.6], [.7], [.8], [.9]], device=device))
+
+    # the distances are computed once on the individuals of x and y, instead of on their crossed groundings. Then, the
+    # [x, y, d] mask is computed once and it is given to the guarded quantifications that use the same condition, so
+    # the groundings of x, y, and d are not crossed to evaluate a mask_fn
+    sq_dists = pairwise_sq_dist(x.grounding, y.grounding)
+    close_mask = torch.unsqueeze(sq_dists, dim=2) < d.grounding.view(1, 1, -1) ** 2
+    eq_x_y = Eq([x.get_grounding(), y.get_grounding()])
     print(Exists(d.get_grounding(),
            Forall([x.get_grounding(), y.get_grounding()],
-                  Eq([x.get_grounding(), y.get_grounding()]),
+                  eq_x_y,
+                  mask_vars=[x.get_grounding(), y.get_grounding(), d.get_grounding()],
+                  mask=close_mask
+                  )))
+    print(Forall(d.get_grounding(),
+           Exists([x.get_grounding(), y.get_grounding()],
+                  eq_x_y,
                   mask_vars=[x.get_grounding(), y.get_grounding(), d.get_grounding()],
-                  mask_fn=lambda args: eucl_dist(args[0], args[1]) < args[2]
+                  mask=close_mask
                   )))
 
-    samples = np.random.rand(100, 2, 2)  # 100 R^{2x2} values
+    samples = torch.from_numpy(np.random.rand(100, 2, 2)).to(device)  # 100 R^{2x2} values
     labels = np.random.randint(3, size=100)  # 100 labels (class 0/1/2) that correspond to each sample
-    onehot_labels = torch.nn.functional.one_hot(torch.tensor(labels), num_classes=3)
+    onehot_labels = torch.nn.functional.one_hot(torch.from_numpy(labels).to(device), num_classes=3)
 
     x_dom = ltn.Domain([2, 2], 'x_dom')
     l_dom = ltn.Domain([3], 'l_dom')
@@ -101,17 +155,34 @@ def main():
     # TODO sistemare sta cosa che voglio per forza una lista di liste sulle variabili perche' fa diventare matti
     # TODO capire il warning che viene lanciato
 
-    model = ModelC()
+    model = ModelC().to(device)
 
     C = ltn.Predicate('c', [x_dom, l_dom], model)
 
     # %%
 
-    print(C([x.get_grounding(), l.get_grounding()]).shape)  # Computes the 100x100 combinations
-    x, l = ltn.diag([x.get_grounding(), l.get_grounding()])  # sets the diag behavior for x and l
-    print(C([x, l]).shape)  # Computes the 100 zipped combinations
-    x, l = ltn.undiag([x, l])  # resets the normal behavior
-    print(C([x, l]).shape)  # Computes the 100x100 combinations
+    # the learnable predicates are evaluated only to show their outputs, so the autograd graph is not built
+    with torch.no_grad():
+        print(C([x.get_grounding(), l.get_grounding()]).shape)  # Computes the 100x100 combinations
+        x, l = ltn.diag([x.get_grounding(), l.get_grounding()])  # sets the diag behavior for x and l
+        print(C([x, l]).shape)  # Computes the 100 zipped combinations
+        x, l = ltn.undiag([x, l])  # resets the normal behavior
+        print(C([x, l]).shape)  # Computes the 100x100 combinations
+
+    # a categorical variable contains the indexes of the classes, so the classifier is evaluated once per sample and
+    # the truth values of the 3 classes are read from its output
+    c_dom = ltn.Domain([1], 'c_dom')
+    x = ltn.Variable("x", x_dom, samples.float())
+    c = ltn.Variable("c", c_dom, torch.arange(3, device=device).view(-1, 1), categorical=True)
+
+    # the model is compiled with TorchScript, while the ltn predicate wrapping it remains a Python module
+    C_cat = ltn.Predicate('c_cat', [x_dom, c_dom], torch.jit.script(ModelClassifier().to(device)))
+
+    # the parameters and the data of the classifier are in float32, and autocast runs its matrix multiplications in
+    # bfloat16
+    with torch.no_grad(), torch.autocast(device_type=device.type, dtype=torch.bfloat16):
+        print(C_cat([x.get_grounding(), c.get_grounding()]).shape)  # Computes the 100x3 combinations
+        print(C_cat([c.get_grounding(), x.get_grounding()]).free_variables)
 
 
 if __name__ == "__main__":